@@ -1,8 +1,36 @@
-import csv
+import gzip
+import hashlib
+import json
+import math
+import os
+import tempfile
+import time
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, suppress
+from itertools import islice
+from operator import itemgetter
+from pathlib import Path
 from datetime import datetime
-import requests
+import aiohttp
 import argparse
 
+# orjson decodes the API responses considerably faster, but is optional, ujson is the next best choice
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+# zstandard is only needed for zstd-compressed output
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # Import credentials
 from credentials import API_URL, API_TOKEN
 
@@ -11,75 +39,387 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
-def fetch_custom_field_labels(custom_field_id):
+# Upper bound for page requests in flight at the same time against the Paperless-ngx host
+MAX_CONCURRENT_REQUESTS = 16
+# Requested number of results per page, the server may clamp it to its configured maximum
+PAGE_SIZE = 1000
+# Size of the keep-alive connection pool shared by all requests
+CONNECTION_POOL_SIZE = 32
+# Seconds to wait for a connection or the next chunk of a response before a request fails
+REQUEST_TIMEOUT = 30
+# Rate limited and transient server errors are retried with exponential backoff, starting at RETRY_BACKOFF seconds
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Upper bound for a delay requested by a Retry-After header, in seconds
+MAX_RETRY_AFTER = 60
+
+# Buffer size of the exported files, so rows reach the disk in large blocks
+WRITE_BUFFER_SIZE = 1 << 20
+# Number of rows joined into a single write call
+WRITE_BATCH_ROWS = 10000
+# Number of storage box lists written at the same time
+MAX_FILE_WRITERS = 8
+# File name suffixes of the supported output compressions
+COMPRESSION_SUFFIXES = {"none": "", "gz": ".gz", "zst": ".zst"}
+
+# Fields of the API objects used by the exports, requested instead of the full objects
+DOCUMENT_FIELDS = ("id", "archive_serial_number", "correspondent", "created_date", "title", "custom_fields")
+CORRESPONDENT_FIELDS = ("id", "name")
+
+# Correspondents and custom field labels rarely change and are cached on disk between runs
+CACHE_DIR = Path.home() / ".cache" / "paperless-asn-list"
+CACHE_TTL = 24 * 60 * 60
+
+class ApiError(Exception):
+    """
+    Raised when the Paperless-ngx API responds with an error, keeping its HTTP status.
+    """
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+async def _get_json(session, url, description):
+    """
+    Performs a GET request against the Paperless-ngx API and decodes the JSON response.
+    Rate limited requests, transient server errors and dropped connections are retried
+    with exponential backoff, a Retry-After header of the response takes precedence
+    up to MAX_RETRY_AFTER seconds.
+
+    Args:
+        session (aiohttp.ClientSession): Session used for the request.
+        url (str): URL to fetch.
+        description (str): What is being fetched, used in error messages.
+
+    Returns:
+        dict: Decoded JSON response.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        delay = RETRY_BACKOFF * 2 ** attempt
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return json_loads(await response.read())
+                if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                    raise ApiError(f"Failed to fetch {description}: {await response.text()}", response.status)
+                # Only the seconds form, an HTTP date falls back to the backoff
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = min(int(retry_after), MAX_RETRY_AFTER)
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+            if attempt == MAX_RETRIES:
+                raise
+        await asyncio.sleep(delay)
+
+async def _iter_pages(session, first_urls, description, fields=()):
+    """
+    Yields the results of all pages of one or more paginated Paperless-ngx API requests as they arrive.
+    The first page of each request reveals the total count and page size, its remaining pages
+    are then requested concurrently.
+
+    Args:
+        session (aiohttp.ClientSession): Session used for all requests.
+        first_urls (list): URLs of the first pages.
+        description (str): What is being fetched, used in error messages.
+        fields (tuple): Fields to request instead of the full objects. Requests rejected by
+            servers not supporting the selection are repeated without it.
+
+    Yields:
+        list: Results of a single page, in no particular page order.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    fields_query = f"&fields={','.join(fields)}" if fields else ""
+
+    async def fetch_page(url, first_url=None):
+        async with semaphore:
+            try:
+                return first_url, await _get_json(session, url, description)
+            except ApiError as error:
+                if error.status != 400 or not first_url or not fields_query:
+                    raise
+                # The remaining pages derive from the first URL, so they are requested in full as well
+                first_url = first_url[:-len(fields_query)]
+                return first_url, await _get_json(session, first_url, description)
+
+    pending = {
+        asyncio.ensure_future(fetch_page(url + fields_query, first_url=url + fields_query))
+        for url in first_urls
+    }
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                first_url, content = task.result()
+                results = content["results"]
+                if first_url and content["next"] and results:
+                    last_page = math.ceil(content["count"] / len(results))
+                    separator = "&" if "?" in first_url else "?"
+                    pending.update(
+                        asyncio.ensure_future(fetch_page(f"{first_url}{separator}page={page}"))
+                        for page in range(2, last_page + 1)
+                    )
+                yield results
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def _fetch_all_pages(session, first_url, description, fields=()):
+    """
+    Fetches the results of all pages of a paginated Paperless-ngx API endpoint.
+
+    Args:
+        session (aiohttp.ClientSession): Session used for all requests.
+        first_url (str): URL of the first page.
+        description (str): What is being fetched, used in error messages.
+        fields (tuple): Fields to request instead of the full objects.
+
+    Returns:
+        list: Results of all pages, in no particular order.
+    """
+    results = []
+    async for page in _iter_pages(session, [first_url], description, fields):
+        results.extend(page)
+    return results
+
+def _write_cache_entry(path, entry):
+    """
+    Writes a cache entry to a temporary file first and moves it into place, so concurrent runs
+    never read a partially written entry. The cache only saves requests, so failing to write it,
+    e.g. because of an unwritable home directory or a full disk, is ignored.
+
+    Args:
+        path (Path): Path of the cache entry.
+        entry (dict): JSON-serializable cache entry.
+    """
+    temp_path = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write(json.dumps(entry))
+        os.replace(temp_path, path)
+    except OSError:
+        if temp_path is not None:
+            with suppress(OSError):
+                os.unlink(temp_path)
+
+def _cache_path(endpoint):
+    """
+    Returns the path of the cache entry of an API endpoint.
+    Entries are keyed by endpoint and API token, so instances and users never share them.
+    """
+    token_hash = hashlib.sha256(API_TOKEN.encode()).hexdigest()
+    key = hashlib.sha1(f"{endpoint}|{token_hash}".encode()).hexdigest()
+    return CACHE_DIR / f"{key}.json"
+
+async def _cached(endpoint, ttl, fetch):
+    """
+    Returns the JSON-serializable value of an API endpoint from the on-disk cache if it is
+    younger than ttl, otherwise awaits fetch() and stores its result in the cache.
+
+    Args:
+        endpoint (str): URL of the cached API endpoint.
+        ttl (int): Maximum age of the cache entry in seconds, 0 to bypass the cache.
+        fetch (callable): Coroutine function fetching the value on a cache miss.
+
+    Returns:
+        tuple: (cached or freshly fetched value, set of keys remembered as unresolved for the
+            cached value by _remember_unresolved, or None if the value was just fetched)
+    """
+    path = _cache_path(endpoint)
+    if ttl > 0:
+        try:
+            entry = json_loads(path.read_bytes())
+            if time.time() - entry["fetched_at"] < ttl:
+                return entry["value"], set(entry.get("unresolved", ()))
+        except (ValueError, KeyError, TypeError, OSError):
+            # Missing or unreadable entries, e.g. truncated by an interrupted run, count as a miss
+            pass
+    value = await fetch()
+    _write_cache_entry(path, {"endpoint": endpoint, "api_url": API_URL, "fetched_at": time.time(), "value": value})
+    return value, None
+
+def _remember_unresolved(endpoint, keys):
+    """
+    Stores keys the documents refer to but a freshly fetched value lacks, e.g. deleted correspondents
+    or ones the API token can't see, with the cache entry of the value. A cached value lacking
+    only these keys is not fetched again.
+
+    Args:
+        endpoint (str): URL of the cached API endpoint.
+        keys (set): Keys missing from the value.
+    """
+    path = _cache_path(endpoint)
+    try:
+        entry = json_loads(path.read_bytes())
+        entry["unresolved"] = list(keys)
+    except (ValueError, TypeError, OSError):
+        # The entry of the fresh value couldn't be written, there is nothing to add the keys to
+        return
+    _write_cache_entry(path, entry)
+
+async def fetch_custom_field_labels(session, custom_field_id, cache_ttl=CACHE_TTL):
     """
     Fetches all possible labels for a custom field with a 'select' data type.
 
     Args:
+        session (aiohttp.ClientSession): Session used for the request.
         custom_field_id (int): ID of the custom field.
+        cache_ttl (int): Maximum age of a cached response in seconds, 0 to bypass the cache.
 
     Returns:
-        dict: Mapping of value IDs to their labels.
+        tuple: (mapping of value IDs to their labels, option values remembered as unresolved,
+            or None if the labels were just fetched)
     """
     url = f"{API_URL}/custom_fields/{custom_field_id}/"
-    response = requests.get(url, headers=HEADERS)
-    if response.status_code != 200:
-        raise Exception(f"Failed to fetch custom field labels: {response.text}")
-    content = response.json()
+    content, unresolved = await _cached(
+        url,
+        cache_ttl,
+        lambda: _get_json(session, url, "custom field labels")
+    )
     select_options = content.get("extra_data", {}).get("select_options", [])
-    return {
+    label_mapping = {
         "name": content["name"],
         "options": {option["id"]: option["label"] for option in select_options}
     }
+    return label_mapping, unresolved
 
-def fetch_correspondents():
+async def fetch_correspondents(session, page_size=PAGE_SIZE, cache_ttl=CACHE_TTL):
     """
     Fetches all correspondents from the Paperless-ngx API.
 
+    Args:
+        session (aiohttp.ClientSession): Session used for all requests.
+        page_size (int): Requested number of results per page.
+        cache_ttl (int): Maximum age of a cached response in seconds, 0 to bypass the cache.
+
+    Returns:
+        tuple: (mapping of correspondent IDs to their names, IDs remembered as unresolved,
+            or None if the correspondents were just fetched)
+    """
+    endpoint = f"{API_URL}/correspondents/"
+    url = f"{endpoint}?page_size={page_size}"
+
+    async def fetch():
+        correspondents = await _fetch_all_pages(session, url, "correspondents", CORRESPONDENT_FIELDS)
+        # Stored as [id, name] pairs, since JSON object keys would turn the integer IDs into strings
+        return [[correspondent["id"], correspondent["name"]] for correspondent in correspondents]
+
+    pairs, unresolved = await _cached(endpoint, cache_ttl, fetch)
+    return dict(pairs), unresolved
+
+async def complete_correspondents(session, documents, correspondents, unresolved, page_size=PAGE_SIZE):
+    """
+    Fetches the correspondents again if the cached ones lack a correspondent a document refers to,
+    e.g. one created after they were cached. IDs still missing from freshly fetched correspondents
+    are remembered in the cache, so later runs don't fetch them again because of these IDs.
+
+    Args:
+        session (aiohttp.ClientSession): Session used for all requests.
+        documents (list): List of document dictionaries.
+        correspondents (dict): Mapping of correspondent IDs to their names.
+        unresolved (set): IDs remembered as unresolved for the cached correspondents,
+            None if they were just fetched.
+        page_size (int): Requested number of results per page.
+
     Returns:
         dict: Mapping of correspondent IDs to their names.
     """
-    url = f"{API_URL}/correspondents/"
-    correspondents_map = {}
-    while url:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch correspondents: {response.text}")
-        content = response.json()
-        for correspondent in content["results"]:
-            correspondents_map[correspondent["id"]] = correspondent["name"]
-        url = content["next"]
-    return correspondents_map
+    missing = {doc["correspondent"] for doc in documents} - correspondents.keys() - {None}
+    if missing and unresolved is not None and not missing <= unresolved:
+        correspondents, unresolved = await fetch_correspondents(session, page_size, cache_ttl=0)
+        missing -= correspondents.keys()
+    if missing and unresolved is None:
+        _remember_unresolved(f"{API_URL}/correspondents/", missing)
+    return correspondents
 
-def fetch_documents(asn_from, asn_to):
+async def iter_documents(session, asn_from, asn_to, page_size=PAGE_SIZE, shard_size=0):
+    """
+    Yields documents within a specific ASN range from the Paperless-ngx API
+    page by page as the pages arrive.
+    The ASN of every document is converted to int once and stored as "_asn",
+    the TSV escaped title as "_title_tsv".
+
+    Args:
+        session (aiohttp.ClientSession): Session used for all requests.
+        asn_from (int): Minimum ASN value.
+        asn_to (int): Maximum ASN value.
+        page_size (int): Requested number of results per page.
+        shard_size (int): If positive, the ASN range is split into sub-ranges of this size,
+            which are fetched concurrently.
+
+    Yields:
+        dict: Document dictionary.
+    """
+    if asn_to < asn_from:
+        # An empty range, nothing to request
+        return
+    step = shard_size if shard_size > 0 else asn_to - asn_from + 1
+    urls = [
+        f"{API_URL}/documents/?archive_serial_number__gte={shard_from}"
+        f"&archive_serial_number__lte={min(shard_from + step - 1, asn_to)}&page_size={page_size}"
+        for shard_from in range(asn_from, asn_to + 1, step)
+    ]
+    async for results in _iter_pages(session, urls, "documents", DOCUMENT_FIELDS):
+        for doc in results:
+            doc["_asn"] = int(doc["archive_serial_number"])
+            doc["_title_tsv"] = _tsv_field(doc["title"])
+            yield doc
+
+async def fetch_documents(session, asn_from, asn_to, page_size=PAGE_SIZE, shard_size=0):
     """
     Fetches documents within a specific ASN range from the Paperless-ngx API
-    and calculates the min and max ASN values.
+    and calculates the min and max ASN values while they arrive.
 
     Args:
+        session (aiohttp.ClientSession): Session used for all requests.
         asn_from (int): Minimum ASN value.
         asn_to (int): Maximum ASN value.
+        page_size (int): Requested number of results per page.
+        shard_size (int): If positive, the ASN range is split into sub-ranges of this size,
+            which are fetched concurrently.
 
     Returns:
         tuple: (list of document dictionaries, min ASN, max ASN)
     """
-    url = f"{API_URL}/documents/?archive_serial_number__gte={asn_from}&archive_serial_number__lte={asn_to}"
     documents = []
-    while url:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch documents: {response.text}")
-        content = response.json()
-        documents.extend(content["results"])
-        url = content["next"]
-    asn_values = [int(doc["archive_serial_number"]) for doc in documents]
-    actual_min_asn = min(asn_values) if asn_values else asn_from
-    actual_max_asn = max(asn_values) if asn_values else asn_to
+    actual_min_asn = actual_max_asn = None
+    async for doc in iter_documents(session, asn_from, asn_to, page_size, shard_size):
+        asn = doc["_asn"]
+        if actual_min_asn is None or asn < actual_min_asn:
+            actual_min_asn = asn
+        if actual_max_asn is None or asn > actual_max_asn:
+            actual_max_asn = asn
+        documents.append(doc)
+    if not documents:
+        return documents, asn_from, asn_to
     return documents, actual_min_asn, actual_max_asn
 
+def resolve_correspondent_names(documents, correspondents):
+    """
+    Looks up the correspondent name of every document once and stores it TSV escaped as "_corr_tsv",
+    along with its sort key as "_corr_sort".
+
+    Args:
+        documents (list): List of document dictionaries.
+        correspondents (dict): Mapping of correspondent IDs to their names.
+    """
+    # Escaped once per correspondent instead of once per document and export. The sort key is
+    # case-insensitive first, the name itself keeps names differing only in case apart.
+    resolved = {
+        correspondent_id: (_tsv_field(name), (name.lower(), name))
+        for correspondent_id, name in correspondents.items()
+    }
+    unknown = ("Unknown", ("unknown", "Unknown"))
+    # A single lookup per document for both values
+    get = resolved.get
+    for doc in documents:
+        doc["_corr_tsv"], doc["_corr_sort"] = get(doc["correspondent"], unknown)
+
 def group_documents_by_custom_field(documents, custom_field_name, custom_field_id, label_mapping):
     """
     Groups documents by a specified custom field label.
+    The TSV escaped label is also stored as "_group_tsv" on every document.
 
     Args:
         documents (list): List of document dictionaries.
@@ -87,205 +427,321 @@ def group_documents_by_custom_field(documents, custom_field_name, custom_field_i
         label_mapping (dict): Mapping of value IDs to their labels.
 
     Returns:
-        dict: Grouped documents where keys are custom field labels and values are lists of document dictionaries.
+        tuple: (grouped documents where keys are custom field labels and values are lists of document dictionaries,
+            ordered case-insensitively by label, set of values missing from the select options)
     """
-    grouped_documents = {}
+    options = label_mapping.get("options")
+    unknown_values = set()
+    # Labels resolved per distinct value, most documents share a handful of values
+    labels = {None: "Unknown", "": "Unknown"}
+    escaped = {"Unknown": "Unknown"}
+    grouped_documents = defaultdict(list)
     for document in documents:
-        custom_fields = document.get("custom_fields", [])
-        group_key = "Unknown"
-        for field in custom_fields:
+        # A plain loop with break, profiling showed it to be several times faster than next() over a generator
+        value = None
+        for field in document.get("custom_fields") or ():
             if field["field"] == custom_field_id:
                 value = field.get("value")
-                if value in (None, ""):
-                    group_key = "Unknown"
-                else:
-                    if label_mapping.get("options"):
-                        group_key = label_mapping["options"].get(value, str(value))
-                    else:
-                        group_key = str(value)
                 break
-        grouped_documents.setdefault(group_key, []).append(document)
-    return grouped_documents
+        try:
+            group_key = labels[value]
+        except KeyError:
+            if options and value not in options:
+                # E.g. an option added after the labels were cached
+                unknown_values.add(value)
+            group_key = labels[value] = options.get(value, str(value)) if options else str(value)
+        except TypeError:
+            # Unhashable values, e.g. lists of a document link field
+            group_key = str(value)
+        try:
+            document["_group_tsv"] = escaped[group_key]
+        except KeyError:
+            document["_group_tsv"] = escaped[group_key] = _tsv_field(group_key)
+        grouped_documents[group_key].append(document)
+    # Lowercased once per label, the label itself keeps labels differing only in case apart
+    grouped_documents = {
+        label: grouped_documents[label] for _, label in sorted((label.lower(), label) for label in grouped_documents)
+    }
+    return grouped_documents, unknown_values
+
+# Sort keys of the normalized documents
+# Documents of the same correspondent and date are ordered by ASN, independent of the API result order
+_correspondent_date_key = itemgetter("_corr_sort", "created_date", "_asn")
+_asn_key = itemgetter("_asn")
+
+def _tsv_field(value):
+    """
+    Formats a value as tab-separated field. Like csv.writer, the field is quoted
+    if it contains a tab, a line break or a double quote.
+    """
+    value = str(value)
+    if "\t" in value or "\n" in value or "\r" in value or '"' in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+def _tsv_line(*fields):
+    """
+    Formats fields as a tab-separated line, terminated by CRLF like csv.writer does.
+    """
+    return "\t".join(map(_tsv_field, fields)) + "\r\n"
 
-def export_correspondent_documents_list(grouped_by_custom_field, correspondents, asn_from, asn_to, is_grouped, custom_field_name="StorageBox"):
+def _write_lines(file, lines):
+    """
+    Writes lines to a file joined into large blocks instead of one write call per line.
+
+    Args:
+        file: Text file opened for writing.
+        lines (iterator): Lines to write, including line terminators.
+    """
+    batch = list(islice(lines, WRITE_BATCH_ROWS))
+    while batch:
+        file.write("".join(batch))
+        batch = list(islice(lines, WRITE_BATCH_ROWS))
+
+def _open_export(filename, compression):
+    """
+    Opens an export file for writing text, compressed as requested.
+
+    Args:
+        filename (str): Name of the uncompressed file, the compression suffix is appended to it.
+        compression (str): One of "none", "gz" or "zst".
+
+    Returns:
+        tuple: (file object, actual file name)
+    """
+    filename += COMPRESSION_SUFFIXES[compression]
+    if compression == "gz":
+        file = gzip.open(filename, mode="wt", newline="", encoding="utf-8", compresslevel=1)
+    elif compression == "zst":
+        file = zstandard.open(filename, mode="wt", cctx=zstandard.ZstdCompressor(level=3), newline="", encoding="utf-8")
+    else:
+        file = open(filename, mode="w", newline="", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+    return file, filename
+
+def export_correspondent_documents_list(documents, asn_from, asn_to, is_grouped, timestamp, custom_field_name="StorageBox", compression="none"):
     """
     Exports a list containing all documents in range,
-    either primary-grouped by custom field or primary-ungrouped
-    and always secondary-grouped by correspondent.
+    grouped by correspondent and with or without the custom field label column.
+    The documents are expected to be sorted by correspondent and date already.
+    The timestamp prefix of the file name is computed once per run by the caller.
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_grouped_by_Correspondent_ASN_{asn_from}-{asn_to}.csv"
-    with open(filename, mode="w", newline="", encoding="utf-8") as file:
-        writer = csv.writer(file, delimiter="\t")
-        writer.writerow([
+    file, filename = _open_export(f"{timestamp}_grouped_by_Correspondent_ASN_{asn_from}-{asn_to}.csv", compression)
+    with file:
+        file.write(_tsv_line(
             "Correspondent",
             "Date", "Title",
             *([custom_field_name] if is_grouped else []),
-            "ASN"])
-        all_docs = []
-        
-        for group_key, docs in (grouped_by_custom_field.items() if is_grouped else [("", grouped_by_custom_field)]):
-            for doc in docs:
-                doc['storage_box'] = group_key
-                all_docs.append(doc)
-        
-        correspondent_groups = {}
-        
-        for doc in all_docs:
-            name = correspondents.get(doc["correspondent"], "Unknown")
-            correspondent_groups.setdefault(name, []).append(doc)
-        
-        for name in sorted(correspondent_groups.keys(), key=str.lower):
-            docs = sorted(correspondent_groups[name], key=lambda d: d["created_date"])
-            for doc in docs:
-                writer.writerow([
-                    name,
-                    doc["created_date"],
-                    doc["title"],
-                    *([doc['storage_box']] if is_grouped else []),
-                    doc["archive_serial_number"]
-                ])
+            "ASN"))
+        if is_grouped:
+            _write_lines(file, (
+                f"{doc['_corr_tsv']}\t{doc['created_date']}\t{doc['_title_tsv']}\t"
+                f"{doc['_group_tsv']}\t{doc['archive_serial_number']}\r\n"
+                for doc in documents
+            ))
+        else:
+            _write_lines(file, (
+                f"{doc['_corr_tsv']}\t{doc['created_date']}\t{doc['_title_tsv']}\t"
+                f"{doc['archive_serial_number']}\r\n"
+                for doc in documents
+            ))
     print(f"Documents list exported to {filename}")
     return filename
 
-def export_custom_field_by_correspondent(custom_field_name, grouped_by_custom_field, correspondents):
+def _write_box(custom_field_name, box, docs, timestamp, compression):
+    """
+    Writes both lists of a single storage box, the one grouped by correspondent and
+    the one sorted by ASN, in a single pass over its documents.
+
+    Args:
+        custom_field_name (str): Name of the custom field, used as column header.
+        box (str): Custom field label of the storage box.
+        docs (list): Documents of the box, sorted by correspondent and date.
+        timestamp (str): Timestamp prefix of the file names.
+        compression (str): One of "none", "gz" or "zst".
+
+    Returns:
+        tuple: (name of the list by correspondent, name of the list by ASN)
     """
-    Exports one list per storage box, grouped by correspondent and sorted by date.
+    docs_by_asn = sorted(docs, key=_asn_key)
+    min_asn, max_asn = docs_by_asn[0]["_asn"], docs_by_asn[-1]["_asn"]
+    box_field = _tsv_field(box)
+
+    with ExitStack() as stack:
+        by_correspondent, by_correspondent_name = _open_export(
+            f"{timestamp}_{box}_grouped_by_Correspondent_ASN_{min_asn}-{max_asn}.csv", compression)
+        stack.enter_context(by_correspondent)
+        by_asn, by_asn_name = _open_export(f"{timestamp}_{box}_grouped_by_ASN_{min_asn}-{max_asn}.csv", compression)
+        stack.enter_context(by_asn)
+
+        by_correspondent.write(_tsv_line(custom_field_name, "Correspondent", "Date", "Title", "ASN"))
+        by_asn.write(_tsv_line(custom_field_name, "ASN", "Correspondent", "Title", "Date"))
+
+        # Both files advance block by block through the same range of rows
+        for start in range(0, len(docs), WRITE_BATCH_ROWS):
+            end = start + WRITE_BATCH_ROWS
+            by_correspondent.write("".join(
+                f"{box_field}\t{doc['_corr_tsv']}\t{doc['created_date']}\t"
+                f"{doc['_title_tsv']}\t{doc['archive_serial_number']}\r\n"
+                for doc in docs[start:end]
+            ))
+            by_asn.write("".join(
+                f"{box_field}\t{doc['archive_serial_number']}\t{doc['_corr_tsv']}\t"
+                f"{doc['_title_tsv']}\t{doc['created_date']}\r\n"
+                for doc in docs_by_asn[start:end]
+            ))
+    return by_correspondent_name, by_asn_name
+
+def export_all(documents, grouped_by_custom_field, asn_from, asn_to, custom_field_name, timestamp, compression="none"):
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filenames = []
-    for box in sorted(grouped_by_custom_field.keys(), key=str.lower):
-        docs = grouped_by_custom_field[box]
-        min_asn = min(int(doc["archive_serial_number"]) for doc in docs)
-        max_asn = max(int(doc["archive_serial_number"]) for doc in docs)
-
-        filename = f"{timestamp}_{box}_grouped_by_Correspondent_ASN_{min_asn}-{max_asn}.csv"
-
-        with open(filename, mode="w", newline="", encoding="utf-8") as file:
-            writer = csv.writer(file, delimiter="\t")
-            writer.writerow([
-                custom_field_name,
-                "Correspondent",
-                "Date",
-                "Title",
-                "ASN"])
-
-            corr_groups = {}
-
-            for doc in docs:
-                name = correspondents.get(doc["correspondent"], "Unknown")
-                corr_groups.setdefault(name, []).append(doc)
-            for name in sorted(corr_groups.keys(), key=str.lower):
-                sorted_docs = sorted(corr_groups[name], key=lambda d: d["created_date"])
-                for doc in sorted_docs:
-                    writer.writerow([
-                        box,
-                        name,
-                        doc["created_date"],
-                        doc["title"],
-                        doc["archive_serial_number"]])
-        filenames.append(filename)
-        print(f"Storage box list (by correspondent) exported to {filename}")
-    return filenames
-
-def export_custom_field_by_asn(custom_field_name, grouped_by_custom_field, correspondents):
-    """
-    Exports one list per storage box, sorted by ASN.
+    Exports the list of all documents and both lists of every storage box.
+    The overall list and the storage boxes are written concurrently.
+
+    Args:
+        documents (list): All documents, sorted by correspondent and date.
+        grouped_by_custom_field (dict): Documents grouped by storage box, in output order and
+            sorted by correspondent and date within each box.
+        asn_from (int): Minimum ASN of all documents.
+        asn_to (int): Maximum ASN of all documents.
+        custom_field_name (str): Name of the custom field, used as column header.
+        timestamp (str): Timestamp prefix of the file names.
+        compression (str): One of "none", "gz" or "zst".
     """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filenames = []
-    for box in sorted(grouped_by_custom_field.keys(), key=str.lower):
-        docs = grouped_by_custom_field[box]
-        min_asn = min(int(doc["archive_serial_number"]) for doc in docs)
-        max_asn = max(int(doc["archive_serial_number"]) for doc in docs)
-
-        filename = f"{timestamp}_{box}_grouped_by_ASN_{min_asn}-{max_asn}.csv"
-
-        with open(filename, mode="w", newline="", encoding="utf-8") as file:
-            writer = csv.writer(file, delimiter="\t")
-            writer.writerow([
-                custom_field_name,
-                "ASN",
-                "Correspondent",
-                "Title",
-                "Date"])
-
-            docs.sort(key=lambda d: int(d["archive_serial_number"]))
-
-            for doc in docs:
-                name = correspondents.get(doc["correspondent"], "Unknown")
-                writer.writerow([
-                    box,
-                    doc["archive_serial_number"],
-                    name,
-                    doc["title"],
-                    doc["created_date"]])
-        filenames.append(filename)
-        print(f"Storage box list (by ASN) exported to {filename}")
-    return filenames
-
-def run_export_without_custom_field(asn_from, asn_to, correspondents_map):
-    documents, actual_min_asn, actual_max_asn = fetch_documents(asn_from, asn_to)
+    with ThreadPoolExecutor(max_workers=MAX_FILE_WRITERS) as executor:
+        overall = executor.submit(
+            export_correspondent_documents_list,
+            documents=documents,
+            asn_from=asn_from,
+            asn_to=asn_to,
+            is_grouped=True,
+            custom_field_name=custom_field_name,
+            timestamp=timestamp,
+            compression=compression
+        )
+        box_filenames = list(executor.map(
+            lambda box: _write_box(custom_field_name, box, grouped_by_custom_field[box], timestamp, compression),
+            grouped_by_custom_field
+        ))
+        overall.result()
+    for by_correspondent_name, _ in box_filenames:
+        print(f"Storage box list (by correspondent) exported to {by_correspondent_name}")
+    for _, by_asn_name in box_filenames:
+        print(f"Storage box list (by ASN) exported to {by_asn_name}")
+
+async def run_export_without_custom_field(session, asn_from, asn_to, timestamp, compression, page_size, shard_size, cache_ttl):
+    # Independent requests, so they run concurrently
+    (documents, actual_min_asn, actual_max_asn), (correspondents_map, unresolved_correspondents) = await asyncio.gather(
+        fetch_documents(session, asn_from, asn_to, page_size, shard_size),
+        fetch_correspondents(session, page_size, cache_ttl)
+    )
+    correspondents_map = await complete_correspondents(
+        session, documents, correspondents_map, unresolved_correspondents, page_size
+    )
+    resolve_correspondent_names(documents, correspondents_map)
+    documents.sort(key=_correspondent_date_key)
     
     export_correspondent_documents_list(
-        grouped_by_custom_field=documents,
-        correspondents=correspondents_map,
+        documents=documents,
         asn_from=actual_min_asn,
         asn_to=actual_max_asn,
-        is_grouped=False
+        is_grouped=False,
+        timestamp=timestamp,
+        compression=compression
     )
 
-def run_export_with_custom_field(asn_from, asn_to, custom_field_id, correspondents_map):
-    documents, actual_min_asn, actual_max_asn = fetch_documents(asn_from, asn_to)
-    label_mapping = fetch_custom_field_labels(custom_field_id)
+async def run_export_with_custom_field(session, asn_from, asn_to, custom_field_id, timestamp, compression, page_size, shard_size, cache_ttl):
+    # Independent requests, so they run concurrently
+    (
+        (documents, actual_min_asn, actual_max_asn),
+        (correspondents_map, unresolved_correspondents),
+        (label_mapping, unresolved_options)
+    ) = await asyncio.gather(
+        fetch_documents(session, asn_from, asn_to, page_size, shard_size),
+        fetch_correspondents(session, page_size, cache_ttl),
+        fetch_custom_field_labels(session, custom_field_id, cache_ttl)
+    )
+    correspondents_map = await complete_correspondents(
+        session, documents, correspondents_map, unresolved_correspondents, page_size
+    )
+    resolve_correspondent_names(documents, correspondents_map)
+    # Sorted once here, grouping keeps the order for the per-box exports by correspondent
+    documents.sort(key=_correspondent_date_key)
     
-    grouped_docs = group_documents_by_custom_field(
+    grouped_docs, unknown_options = group_documents_by_custom_field(
         documents=documents,
         custom_field_name=label_mapping["name"],
         custom_field_id=custom_field_id,
         label_mapping=label_mapping
     )
+    if unknown_options and unresolved_options is not None and not unknown_options <= unresolved_options:
+        # The cached labels lack an option, so they are fetched again and the documents regrouped
+        label_mapping, unresolved_options = await fetch_custom_field_labels(session, custom_field_id, cache_ttl=0)
+        grouped_docs, unknown_options = group_documents_by_custom_field(
+            documents=documents,
+            custom_field_name=label_mapping["name"],
+            custom_field_id=custom_field_id,
+            label_mapping=label_mapping
+        )
+    if unknown_options and unresolved_options is None:
+        # Options still missing after a fresh fetch don't make later runs fetch the labels again
+        _remember_unresolved(f"{API_URL}/custom_fields/{custom_field_id}/", unknown_options)
     
-    export_correspondent_documents_list(
+    export_all(
+        documents=documents,
         grouped_by_custom_field=grouped_docs,
-        correspondents=correspondents_map,
         asn_from=actual_min_asn,
         asn_to=actual_max_asn,
-        is_grouped=True,
-        custom_field_name=label_mapping["name"]
-    )
-    
-    export_custom_field_by_correspondent(
         custom_field_name=label_mapping["name"],
-        grouped_by_custom_field=grouped_docs,
-        correspondents=correspondents_map
-    )
-    
-    export_custom_field_by_asn(
-        custom_field_name=label_mapping["name"],
-        grouped_by_custom_field=grouped_docs,
-        correspondents=correspondents_map
+        timestamp=timestamp,
+        compression=compression
     )
 
+async def main(args):
+    # A single session for the whole run, so connections are kept alive and reused across all requests
+    connector = aiohttp.TCPConnector(limit=CONNECTION_POOL_SIZE, limit_per_host=MAX_CONCURRENT_REQUESTS)
+    # All files of one run share the same timestamp prefix
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # No limit for the whole request, large pages may take a while, but a stalled connection fails
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, headers=HEADERS, timeout=timeout) as session:
+        if args.no_custom_field:
+            await run_export_without_custom_field(
+                session=session,
+                asn_from=args.asn_from,
+                asn_to=args.asn_to,
+                timestamp=timestamp,
+                compression=args.compress,
+                page_size=args.page_size,
+                shard_size=args.shard_size,
+                cache_ttl=0 if args.no_cache else args.cache_ttl
+            )
+        else:
+            await run_export_with_custom_field(
+                session=session,
+                asn_from=args.asn_from,
+                asn_to=args.asn_to,
+                custom_field_id=args.custom_field_id,
+                timestamp=timestamp,
+                compression=args.compress,
+                page_size=args.page_size,
+                shard_size=args.shard_size,
+                cache_ttl=0 if args.no_cache else args.cache_ttl
+            )
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Export documents from Paperless-ngx")
     parser.add_argument("--asn_from", type=int, default=1, help="Minimum ASN value (default: 1)")
     parser.add_argument("--asn_to", type=int, default=9999, help="Maximum ASN value (default: 9999)")
     parser.add_argument("--custom_field_id", type=int, default=3, help="Custom field ID for grouping (default: 3)")
     parser.add_argument("--no_custom_field", action="store_true", help="Deactivate grouping by custom field")
+    parser.add_argument("--page_size", type=int, default=PAGE_SIZE, help=f"Requested number of results per API page (default: {PAGE_SIZE})")
+    parser.add_argument("--shard_size", type=int, default=0, help="Fetch the ASN range in concurrent sub-ranges of this size, 0 to disable (default: 0)")
+    parser.add_argument("--cache_ttl", type=int, default=CACHE_TTL, help=f"Seconds correspondents and custom field labels are cached (default: {CACHE_TTL})")
+    parser.add_argument("--no_cache", action="store_true", help="Fetch correspondents and custom field labels even if cached")
+    parser.add_argument("--compress", choices=list(COMPRESSION_SUFFIXES), default="none", help="Compress the exported lists (default: none)")
     args = parser.parse_args()
+    if args.compress == "zst" and zstandard is None:
+        parser.error("--compress zst requires the zstandard package")
+    if args.page_size < 1:
+        parser.error("--page_size must be at least 1")
 
-    correspondents_map = fetch_correspondents()
-    if args.no_custom_field:
-        run_export_without_custom_field(
-            asn_from=args.asn_from,
-            asn_to=args.asn_to,
-            correspondents_map=correspondents_map
-        )
-    else:
-        run_export_with_custom_field(
-            asn_from=args.asn_from,
-            asn_to=args.asn_to,
-            custom_field_id=args.custom_field_id,
-            correspondents_map=correspondents_map
-        )
+    asyncio.run(main(args))